@@ -0,0 +1,19 @@
+"""Shared AWS Session Module
+
+This module owns the process-wide botocore session used to create every AWS
+client in the Lambda functions. Import it before creating any client.
+
+Author: DJ Rajasekar
+Project: vehicle-number-identifier
+"""
+
+import os
+from botocore.session import Session
+
+# Lambda provides credentials through environment variables, so never fall back to
+# probing the EC2 instance metadata service (must be set before the session exists)
+os.environ.setdefault("AWS_EC2_METADATA_DISABLED", "true")
+
+# Low-level botocore session shared by all modules, so service data is only loaded
+# once and boto3's resource layer (unused here) is never imported
+session = Session()
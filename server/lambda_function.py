@@ -8,8 +8,18 @@ Author: DJ Rajasekar
 Project: vehicle-number-identifier
 """
 
-import boto3, json, re
-from publisher import publish
+import base64, hashlib, logging, orjson, os, re, time
+from aws import session
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from publisher import prewarm, publish
+
+# Use lazy %-formatting so large payloads are only rendered when the level allows it
+logger = logging.getLogger()
+# Accept any case and fall back to INFO on unknown names rather than failing at import
+log_level = os.environ.get("LOG_LEVEL", "INFO").upper()
+logger.setLevel(log_level if isinstance(logging.getLevelName(log_level), int) else logging.INFO)
 
 # US state names are frequent false positives on license plates (e.g. VIRGINIA)
 US_STATE_NAMES = {
@@ -29,8 +39,96 @@ NOISE_WORDS = {
     "VIEW", "GALLERY", "PARKING", "RESIDENT", "RESTAURANT"
 }
 
+# Compiled once per container so validation doesn't rebuild patterns per detection
+NON_ALPHANUMERIC_PATTERN = re.compile(r'[^A-Z0-9]')
+
+# 5-8 alphanumeric characters containing at least one letter and one digit
+PLATE_PATTERN = re.compile(r'^(?=[A-Z0-9]*[A-Z])(?=[A-Z0-9]*[0-9])[A-Z0-9]{5,8}$')
+
+# Server-side DetectText filter: drop low-confidence words before they are returned,
+# so less noise is sent over the wire and validated here. No bounding box size
+# thresholds: plate words are often under 5% of the image width (see
+# sample_responses/audi1.json)
+DETECT_TEXT_FILTERS = {
+    'WordFilter': {
+        'MinConfidence': 80
+    }
+}
+
+# DynamoDB table caching detected plates by image ETag across containers.
+# Leave PLATE_CACHE_TABLE unset to disable. The table's partition key is the
+# string attribute "etag"; enable TTL on the "expires_at" attribute.
+PLATE_CACHE_TABLE = os.environ.get("PLATE_CACHE_TABLE")
+PLATE_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+
+# SQS queue consumed by publisher.queue_handler. When set, results are queued and
+# this function returns without waiting on the WebSocket post; leave unset to
+# publish directly.
+PUBLISH_QUEUE_URL = os.environ.get("PUBLISH_QUEUE_URL")
+
+# Pin the region explicitly so client creation never has to resolve it
+client_config = Config(region_name='us-east-1')
+
+
+def strip_geometry(response_dict, **kwargs):
+    """Drop Geometry from raw DetectText responses before botocore parses them
+    
+    Most of a DetectText payload is bounding box and polygon floats which this
+    function never reads. Removing them from the raw JSON body means botocore's
+    model-based parser doesn't have to build dicts for every coordinate.
+    
+    Args:
+        response_dict (dict): Raw HTTP response from botocore (body is bytes)
+        **kwargs: Other event arguments supplied by botocore (unused)
+    """
+    if(response_dict.get('status_code') != 200):
+        return
+    body = orjson.loads(response_dict['body'])
+    for item in body.get("TextDetections", []):
+        item.pop("Geometry", None)
+    response_dict['body'] = orjson.dumps(body)
+
+
+# Per-container clients and workers. All are snapshot-safe for SnapStart or
+# provisioned concurrency: botocore clients open their HTTPS connections lazily on
+# the first request, and the executor only starts its worker thread on first submit.
+
 # Initialize S3 client for accessing uploaded vehicle images
-s3_client = boto3.client('s3', "us-east-1")
+s3_client = session.create_client('s3', config=client_config)
+
+# Initialize DynamoDB client for the shared plate cache
+dynamodb_client = session.create_client('dynamodb', config=client_config)
+
+# Initialize Rekognition client once per container so warm invocations reuse it
+rekognition_client = session.create_client('rekognition', config=client_config)
+
+# Initialize SQS client for handing results off to the publisher Lambda
+sqs_client = session.create_client('sqs', config=client_config)
+
+# Background worker used to overlap the WebSocket connection setup with Rekognition
+executor = ThreadPoolExecutor(max_workers=1)
+
+
+def _bootstrap():
+    """Finish the heavy per-container setup of the clients at import time
+    
+    Registers the DetectText response hook and resolves the operation models used
+    per request, so a snapshot (or the first warm invocation) doesn't pay the lazy
+    model/shape loading cost.
+    """
+    rekognition_client.meta.events.register('before-parse.rekognition.DetectText', strip_geometry)
+
+    for client, operation_name in (
+        (rekognition_client, 'DetectText'),
+        (s3_client, 'HeadObject'),
+        (dynamodb_client, 'GetItem'),
+        (dynamodb_client, 'PutItem'),
+        (sqs_client, 'SendMessage')
+    ):
+        client.meta.service_model.operation_model(operation_name).output_shape
+
+
+_bootstrap()
 
 # ============================================================================
 # MAIN HANDLER
@@ -42,12 +140,16 @@ def lambda_handler(event, context):
     Workflow:
     1. Receives message from frontend via WebSocket containing S3 image location
     2. Extracts bucket name and image key from the message
-    3. Calls Rekognition to detect text in the image
-    4. Sends detected number plate back to frontend via WebSocket
+    3. Calls Rekognition to detect text in the image, while opening the
+       WebSocket management connection in the background
+    4. Sends detected number plate back to frontend via WebSocket, either
+       directly or by queueing it for the publisher Lambda (PUBLISH_QUEUE_URL)
     
     Args:
         event (dict): API Gateway WebSocket event containing:
-            - body: JSON string with bucket and key information
+            - body: JSON string with bucket and key information, and optionally
+              image_b64 holding the image itself (only for images of roughly
+              23 KB or less, as API Gateway caps a WebSocket frame at 32 KB)
             - requestContext: Contains connectionId for WebSocket response
         context (object): Lambda context object (not used)
     
@@ -56,75 +158,192 @@ def lambda_handler(event, context):
     """
     
     try:
-        print(f'event: {event}')
+        logger.debug('event: %s', event)
         
         # Parse the incoming WebSocket message
-        message_body = json.loads(event["body"])        
+        message_body = orjson.loads(event["body"])        
         message =  message_body['message']        
         bucket = message["bucket"]  # S3 bucket name
         key = message["key"]        # Image filename in S3
+
+        # Small images may be sent inline so Rekognition can skip the S3 fetch
+        image_bytes = None
+        if(message.get("image_b64")):
+            image_bytes = base64.b64decode(message["image_b64"])
         
         # Get WebSocket connection ID for sending response back to client
         connection_id = event["requestContext"].get("connectionId")
         
-        print(f'bucket: {bucket}, key: {key}, connection_id: {connection_id} ')
+        logger.info('bucket: %s, key: %s, connection_id: %s', bucket, key, connection_id)
+
+        # Establish the publish connection while Rekognition is running
+        prewarm_future = None
+        if(connection_id is not None and not PUBLISH_QUEUE_URL):
+            prewarm_future = executor.submit(prewarm, connection_id)
 
         # Process the image and extract number plate using AWS Rekognition
-        number_plate = extract_number_plate(bucket, key)
+        number_plate = extract_number_plate(bucket, key, image_bytes)
         
         # Send result back to frontend via WebSocket if connection exists
-        if(connection_id != None):
+        if(connection_id is not None and PUBLISH_QUEUE_URL):
+            # Hand off to the publisher Lambda instead of waiting on the post
+            sqs_client.send_message(
+                QueueUrl=PUBLISH_QUEUE_URL,
+                MessageBody=orjson.dumps({"connection_id": connection_id, "message": number_plate}).decode()
+            )
+        elif(connection_id is not None):
+            prewarm_future.result()
             publish(connection_id, number_plate)
         
         # Return success response to API Gateway
         return {
             'statusCode': 200,
-            'body': json.dumps({"success": True, "message": number_plate})
+            'body': orjson.dumps({"success": True, "message": number_plate}).decode()
         }
         
-    except Exception as error:
-        # Log error and return failure response
-        print(f'Error occurrred. {error}')
+    except Exception:
+        # Log error with its traceback and return failure response
+        logger.exception('Error occurred.')
         return {
             'statusCode': 500,
-            'body': json.dumps({"success": False, "message": "Failed"})
+            'body': orjson.dumps({"success": False, "message": "Failed"}).decode()
         }
 
 # ============================================================================
 # IMAGE PROCESSING FUNCTIONS
 # ============================================================================
 
-def extract_number_plate(bucket, key):
+def extract_number_plate(bucket, key, image_bytes=None):
     """Extract number plate from vehicle image
     
     This function orchestrates the number plate extraction by:
-    1. Getting all detected text from the image
-    2. Returning the first valid number plate found
+    1. Looking up the image's ETag so re-uploads of the same image are recognised
+       (or hashing the inline image bytes, which matches the S3 ETag of a
+       single-part upload)
+    2. Getting the best valid number plate (cached per bucket/key/ETag)
+    3. Returning it, or an error message if none was found
     
     Args:
         bucket (str): S3 bucket name where image is stored
         key (str): S3 object key (filename) of the vehicle image
+        image_bytes (bytes): Optional inline image content sent by the frontend
     
     Returns:
         str: Detected number plate or error message if not found
     """
-    detected_plate_list = get_detected_text_list(bucket, key)
-    print('List', detected_plate_list)
+    if(image_bytes is not None):
+        # Inline images skip the in-container cache so their bytes aren't retained
+        etag = '"%s"' % hashlib.md5(image_bytes).hexdigest()
+        detected_plate = get_plate(bucket, key, etag, image_bytes)
+    else:
+        # ETag changes whenever the object content changes, so it is safe to key on
+        etag = s3_client.head_object(Bucket=bucket, Key=key)["ETag"]
+        detected_plate = get_cached_plate(bucket, key, etag)
+    logger.info('Plate: %s', detected_plate)
     
-    # Return first valid number plate found, or error message
-    if(detected_plate_list != None and len(detected_plate_list) > 0):
-        return detected_plate_list[0]
+    # Return the best valid number plate found, or error message
+    if(detected_plate is not None):
+        return detected_plate
     return "Unable to find number"
 
 
-def get_detected_text_list(bucket, key):
+@lru_cache(maxsize=512)
+def get_cached_plate(bucket, key, etag):
+    """Return the detected number plate for an S3 object, cached in container memory
+    
+    Lambda containers persist between warm invocations, so repeated requests for
+    the same image (e.g. a user retrying an upload) skip the Rekognition call.
+    
+    Args:
+        bucket (str): S3 bucket name
+        key (str): S3 object key (image filename)
+        etag (str): S3 object ETag, used only to key the cache on image content
+    
+    Returns:
+        str: Best validated number plate text, or None if nothing qualifies
+    """
+    return get_plate(bucket, key, etag)
+
+
+def get_plate(bucket, key, etag, image_bytes=None):
+    """Return the detected number plate, checking the shared DynamoDB cache first
+    
+    Args:
+        bucket (str): S3 bucket name
+        key (str): S3 object key (image filename)
+        etag (str): ETag identifying the image content
+        image_bytes (bytes): Optional inline image content to send to Rekognition
+    
+    Returns:
+        str: Best validated number plate text, or None if nothing qualifies
+    """
+    detected_plate = get_shared_cached_plate(etag)
+    if(detected_plate is not None):
+        return detected_plate
+
+    detected_plate = detect_number_plate(bucket, key, image_bytes)
+    if(detected_plate is not None):
+        put_shared_cached_plate(etag, detected_plate)
+    return detected_plate
+
+
+def get_shared_cached_plate(etag):
+    """Look up a previously detected number plate in the DynamoDB cache
+    
+    The cache is best effort: lookup failures are logged and treated as a miss.
+    
+    Args:
+        etag (str): S3 object ETag identifying the image content
+    
+    Returns:
+        str: Cached number plate text, or None on a miss or when disabled
+    """
+    if(not PLATE_CACHE_TABLE):
+        return None
+    try:
+        item = dynamodb_client.get_item(
+            TableName=PLATE_CACHE_TABLE,
+            Key={'etag': {'S': etag}}
+        ).get('Item')
+    except Exception as error:
+        logger.warning('Plate cache lookup failed. %s', error)
+        return None
+    if(item is None):
+        return None
+    return item['plate']['S']
+
+
+def put_shared_cached_plate(etag, plate):
+    """Store a detected number plate in the DynamoDB cache with a TTL
+    
+    Args:
+        etag (str): S3 object ETag identifying the image content
+        plate (str): Detected number plate text
+    """
+    if(not PLATE_CACHE_TABLE):
+        return
+    try:
+        dynamodb_client.put_item(
+            TableName=PLATE_CACHE_TABLE,
+            Item={
+                'etag': {'S': etag},
+                'plate': {'S': plate},
+                'expires_at': {'N': str(int(time.time()) + PLATE_CACHE_TTL_SECONDS)}
+            }
+        )
+    except Exception as error:
+        logger.warning('Plate cache update failed. %s', error)
+
+
+def detect_number_plate(bucket, key, image_bytes=None):
     """Use AWS Rekognition to detect text in vehicle image
     
     This function:
-    1. Calls AWS Rekognition DetectText API on the S3 image
-    2. Extracts all detected text from the response
-    3. Validates each detected text to filter out non-number-plate text
-    4. Returns a list of valid number plates
+    1. Calls AWS Rekognition DetectText API on the inline image bytes if given,
+       otherwise on the S3 image
+    2. Validates each detected text to filter out non-number-plate text
+    3. Keeps the highest scoring candidate in a single pass over the detections
+    4. Returns that candidate as the number plate
     
     AWS Rekognition can detect various text in an image (street signs, billboards, etc.)
     We use validation logic to identify which text is likely the number plate.
@@ -132,54 +351,51 @@ def get_detected_text_list(bucket, key):
     Args:
         bucket (str): S3 bucket name
         key (str): S3 object key (image filename)
+        image_bytes (bytes): Optional inline image content (roughly 23 KB at most,
+            as the whole WebSocket message must fit in API Gateway's 32 KB frame)
     
     Returns:
-        list: List of validated number plate texts
+        str: Best validated number plate text, or None if nothing qualifies
     """
     response = {}
     
-    # Initialize AWS Rekognition client
-    client = boto3.client('rekognition', "us-east-1")
-    
+    # Inline bytes save Rekognition a fetch from S3; otherwise point it at the object
+    if(image_bytes is not None):
+        image = {'Bytes': image_bytes}
+    else:
+        image = {
+            'S3Object': {
+                'Bucket': bucket,
+                'Name': key
+            }
+        }
+
     # Call Rekognition DetectText API
     # This API detects text in images using machine learning OCR
-    response = client.detect_text(Image= {
-        'S3Object': {
-            'Bucket': bucket,
-            'Name': key
-        }
-    })
-    print(f'Response: {response}')
+    response = rekognition_client.detect_text(Image=image, Filters=DETECT_TEXT_FILTERS)
+    logger.debug('Rekognition response: %s', response)
     
     # Extract all text detections from response
-    list_of_detected_object = response["TextDetections"]
+    text_detections = response["TextDetections"]
     
-    # Filter and validate detected text to find number plates
-    list_of_detected_text = []
-    candidate_scores = {}
-    if(list_of_detected_object != None):
-        for item in list_of_detected_object:
+    # Track only the best candidate instead of building and sorting a full list
+    best_text = None
+    best_score = None
+    if(text_detections is not None):
+        for item in text_detections:
             # Validate each detected text (checks format, characters, known false positives)
             validated_text = validate_detected_text(item["DetectedText"])
-            if(validated_text != None):
-                confidence = item.get("Confidence", 0)
-                text_type = item.get("Type", "")
-                score = confidence + (5 if text_type == "LINE" else 0)
-                existing_score = candidate_scores.get(validated_text)
-                if(existing_score is None or score > existing_score):
-                    candidate_scores[validated_text] = score
-
-    if(candidate_scores):
-        # Highest confidence candidate is most likely the actual license plate.
-        list_of_detected_text = [
-            text for text, _ in sorted(
-                candidate_scores.items(),
-                key=lambda pair: pair[1],
-                reverse=True
-            )
-        ]
+            if(validated_text is None):
+                continue
+
+            # Highest confidence candidate is most likely the actual license plate.
+            # LINE entries get a small bonus as plates are often split into words.
+            score = item.get("Confidence", 0) + (5 if item.get("Type") == "LINE" else 0)
+            if(best_score is None or score > best_score):
+                best_text = validated_text
+                best_score = score
 
-    return list_of_detected_text
+    return best_text
 
 
 # ============================================================================
@@ -208,18 +424,14 @@ def validate_detected_text(text):
         str: Validated number plate text, or None if invalid
     """
     # Normalize text: uppercase and keep only alphanumeric characters.
-    compact_text = re.sub(r'[^A-Z0-9]', '', text.strip().upper())
+    compact_text = NON_ALPHANUMERIC_PATTERN.sub('', text.upper())
 
-    if(len(compact_text) < 5 or len(compact_text) > 8):
+    # License plates are typically 5-8 alphanumeric characters; reject pure words
+    # or pure numbers. Length and character checks are done in a single match.
+    if(PLATE_PATTERN.match(compact_text) is None):
         return None
 
     if(compact_text in US_STATE_NAMES or compact_text in NOISE_WORDS):
         return None
 
-    # License plates are typically alphanumeric; reject pure words or pure numbers.
-    has_alpha = any(ch.isalpha() for ch in compact_text)
-    has_digit = any(ch.isdigit() for ch in compact_text)
-    if(not has_alpha or not has_digit):
-        return None
-
     return compact_text
\ No newline at end of file
@@ -7,19 +7,71 @@ Author: DJ Rajasekar
 Project: vehicle-number-identifier
 """
 
-import json
-import boto3
+import logging
+import os
+import orjson
+from aws import session
 from botocore.config import Config
+from botocore.exceptions import ClientError
+
+# Use lazy %-formatting so payloads are only rendered when the level allows it.
+# The level is set here too, as this module also runs as its own Lambda.
+logger = logging.getLogger()
+# Accept any case and fall back to INFO on unknown names rather than failing at import
+log_level = os.environ.get("LOG_LEVEL", "INFO").upper()
+logger.setLevel(log_level if isinstance(logging.getLevelName(log_level), int) else logging.INFO)
 
 # API Gateway WebSocket callback URL
 # Format: https://{api-id}.execute-api.{region}.amazonaws.com/{stage}/
 # IMPORTANT: Replace with your actual API Gateway WebSocket endpoint
 callbackUrl = "https://mwtqeze40m.execute-api.us-east-1.amazonaws.com/dev-vehicle/"
 
+# Configure AWS client with region, signature version and a small keep-alive pool
+# so warm invocations reuse the TLS connection to API Gateway
+_config = Config(
+    region_name = 'us-east-1',
+    signature_version = 'v4',  # AWS Signature Version 4 for authentication
+    max_pool_connections = 10,
+    retries = {'max_attempts': 2, 'mode': 'standard'},
+    connect_timeout = 1,
+    read_timeout = 3
+)
+
+# Initialize API Gateway Management API client once per container
+# endpoint_url must be HTTPS (not WSS) for the management API. Snapshot-safe: the
+# client only opens its HTTPS connection on the first request (or prewarm).
+_apigw = session.create_client("apigatewaymanagementapi", endpoint_url=callbackUrl, config=_config)
+
+
+def _bootstrap():
+    """Resolve the operation models at import time so the first publish doesn't load them"""
+    for operation_name in ('GetConnection', 'PostToConnection'):
+        _apigw.meta.service_model.operation_model(operation_name).output_shape
+
+
+_bootstrap()
+
 # ============================================================================
 # WEBSOCKET PUBLISHER
 # ============================================================================
 
+def prewarm(connection_id):
+    """Open the HTTPS connection to API Gateway ahead of publishing
+    
+    Issues a cheap GetConnection call so the TLS handshake is completed while the
+    caller is still waiting on Rekognition. The pooled connection is then reused
+    by publish(). This is best effort: any failure is logged and ignored, and
+    publish() will surface real connection problems.
+    
+    Args:
+        connection_id (str): WebSocket connection ID from API Gateway
+    """
+    try:
+        _apigw.get_connection(ConnectionId = connection_id)
+    except Exception as error:
+        logger.warning('Prewarm failed. %s', error)
+
+
 def publish(connection_id, data):    
     """Send data back to frontend client via WebSocket
     
@@ -31,34 +83,60 @@ def publish(connection_id, data):
     - Requires connectionId from the WebSocket connection
     - Data must be JSON serializable
     - Connection ID is obtained from the Lambda event's requestContext
+    - A stale connection (user closed the browser) is logged and ignored
     
     Args:
         connection_id (str): WebSocket connection ID from API Gateway
         data (str): Number plate text or error message to send to frontend
     
     Raises:
-        Exception: If WebSocket post fails (connection closed, invalid ID, etc.)
+        ClientError: If WebSocket post fails for any other reason (invalid ID, etc.)
     
     """
-    # Configure AWS client with region and signature version
-    config = Config(
-        region_name = 'us-east-1',
-        signature_version = 'v4'  # AWS Signature Version 4 for authentication
-    )
-    
     try:
-        # Initialize API Gateway Management API client
-        # endpoint_url must be HTTPS (not WSS) for the management API
-        client = boto3.client("apigatewaymanagementapi", endpoint_url=callbackUrl, config=config)
-        
         # Send JSON response to the specific WebSocket connection
         # Frontend receives this in the ws.onmessage event handler
-        client.post_to_connection(
-            Data = json.dumps({ "success": True, "message": data}),
+        # post_to_connection accepts bytes, so the orjson output is sent as-is
+        _apigw.post_to_connection(
+            Data = orjson.dumps({ "success": True, "message": data}),
             ConnectionId = connection_id
         )
         
-    except Exception as error:
-        # Re-raise exception to be handled by Lambda handler
-        # Common errors: Connection is stale (user closed browser), invalid connection ID
-        raise Exception(error)
\ No newline at end of file
+    except ClientError as error:
+        # The client disconnected before the result was ready; nothing to deliver to
+        if(error.response['Error']['Code'] != 'GoneException'):
+            raise
+        logger.warning('Connection %s is gone, result not delivered', connection_id)
+
+
+# ============================================================================
+# QUEUE CONSUMER
+# ============================================================================
+
+def queue_handler(event, context):
+    """Lambda handler that publishes results queued by lambda_function
+    
+    Used when the main Lambda is configured with PUBLISH_QUEUE_URL, so it can
+    return as soon as the number plate is known. Each SQS record body is JSON
+    with connection_id and message fields.
+    
+    Failed records are reported individually, so SQS only redelivers those and
+    clients whose results were already posted don't receive them twice. The
+    event source mapping must have ReportBatchItemFailures enabled.
+    
+    Args:
+        event (dict): SQS event containing Records
+        context (object): Lambda context object (not used)
+    
+    Returns:
+        dict: batchItemFailures listing the message IDs of records that failed
+    """
+    batch_item_failures = []
+    for record in event["Records"]:
+        try:
+            body = orjson.loads(record["body"])
+            publish(body["connection_id"], body["message"])
+        except Exception:
+            logger.exception('Failed to publish record %s', record["messageId"])
+            batch_item_failures.append({"itemIdentifier": record["messageId"]})
+    return {"batchItemFailures": batch_item_failures}
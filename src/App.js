@@ -11,6 +11,14 @@ const bucketName = process.env.REACT_APP_S3_BUCKET || "vehicle-identifier-bucket
 const awsRegion = process.env.REACT_APP_AWS_REGION || "us-east-1";
 const webSocketUrl = process.env.REACT_APP_WEBSOCKET_URL || "wss://mwtqeze40m.execute-api.us-east-1.amazonaws.com/dev-vehicle/";
 
+// Images up to this size are also sent inline over the WebSocket so Rekognition
+// doesn't have to fetch them from S3. API Gateway closes the connection (code 1009)
+// on any WebSocket frame over 32 KB, and browsers send each ws.send() as a single
+// frame, so the whole serialized payload must fit in 32 KB. Base64 adds about a
+// third, which leaves roughly 23 KB for the raw image.
+const maxFrameBytes = 32 * 1024;
+const maxInlineImageBytes = 23 * 1024;
+
 // AWS credentials: Required for S3 upload authentication
 const creds = {
   accessKeyId: process.env.REACT_APP_AWS_ACCESS_KEY_ID,
@@ -126,7 +134,7 @@ function App() {
     // Step 2: If upload succeeded, notify backend to process the image
     if (uploadResult) {
       const imageName = selectedImage.name;
-      await sendMessage(imageName); // Backend will use this name to fetch from S3
+      await sendMessage(imageName, selectedImage); // Backend will use this name to fetch from S3
     }
   }
 
@@ -178,12 +186,29 @@ function App() {
     return false; // Failed
   }
 
+  // Base64 Image Reader
+  // -------------------
+  // Reads a small image file as base64 (without the data URL prefix) so it can be
+  // sent inline to the backend. Returns null for images too large for a WebSocket frame
+  const readImageAsBase64 = (image) => {
+    if (image.size > maxInlineImageBytes) {
+      return Promise.resolve(null);
+    }
+    return new Promise((resolve) => {
+      const reader = new FileReader();
+      reader.onload = () => resolve(reader.result.split(",")[1]);
+      reader.onerror = () => resolve(null); // Fall back to the S3 copy
+      reader.readAsDataURL(image);
+    });
+  }
+
   // WebSocket Message Sender with Timeout
   // -------------------------------------
   // Sends image filename to backend via WebSocket for number plate detection
-  // Backend will fetch the image from S3, run Rekognition, and send results back
+  // Backend will fetch the image from S3 (or use the inline copy for small images),
+  // run Rekognition, and send results back
   // Timeout: 15 seconds - if no response, alerts user to check backend logs
-  const sendMessage = async (imageName) => {
+  const sendMessage = async (imageName, image) => {
     try {
       // Validate WebSocket exists
       if (!ws) {
@@ -205,9 +230,24 @@ function App() {
         "message": { "bucket": bucketName, "key": imageName } // S3 location of uploaded image
       };
 
+      // Attach small images inline so the backend can skip the S3 round trip,
+      // but only if the whole message still fits in a single 32 KB frame
+      let messageText = JSON.stringify(payload);
+      let sentInline = false;
+      const imageBase64 = image ? await readImageAsBase64(image) : null;
+      if (imageBase64) {
+        const inlinePayload = { ...payload, "message": { ...payload.message, "image_b64": imageBase64 } };
+        const inlineMessageText = JSON.stringify(inlinePayload);
+        if (new Blob([inlineMessageText]).size <= maxFrameBytes) {
+          messageText = inlineMessageText;
+          sentInline = true;
+        }
+      }
+
       // Send message to backend (note: ws.send() is synchronous, doesn't return anything)
-      ws.send(JSON.stringify(payload));
-      console.log('Message sent to websocket:', payload)
+      ws.send(messageText);
+      // Log only the S3 location, not the inline image data
+      console.log('Message sent to websocket:', { bucket: bucketName, key: imageName, inline: sentInline })
 
       setMessage("Processing image....")
 